@@ -122,3 +122,4 @@ git tag $version
 trap - EXIT
 
 print_color "Release prepared to go live - check changes, push code and distribution for release $version"
+print_color "Build the distribution with: python setup.py sdist bdist_wheel"
@@ -14,46 +14,34 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
-try:
-    from setuptools import setup
-    from setuptools.command.test import test as TestCommand
-except ImportError:
-    from distutils.core import setup
-    from distutils.cmd import Command as TestCommand
+from setuptools import setup
 
-from snakebite.version import version
+import os
+import re
 
-import sys
 
-class Tox(TestCommand):
-    user_options = [('tox-args=', None, "Arguments to pass to tox")]
-    def initialize_options(self):
-        TestCommand.initialize_options(self)
-        self.tox_args = ''
-    def finalize_options(self):
-        TestCommand.finalize_options(self)
-        self.test_args = []
-        self.test_suite = True
-    def run_tests(self):
-        #import here, cause outside the eggs aren't loaded
-        import tox
-        errno = tox.cmdline(args=self.tox_args.split())
-        sys.exit(errno)
+def version():
+    # Parse the version from snakebite/version.py instead of importing the
+    # package, so setup.py doesn't need snakebite's dependencies installed
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snakebite', 'version.py')
+    with open(path) as f:
+        return re.search(r'^VERSION\s*=\s*[\'"]([^\'"]+)[\'"]', f.read(), re.M).group(1)
+
 
 install_requires = [
-    'protobuf>2.4.1',
-    'argparse']
+    'protobuf>=3.0.0']
 
 extras_require = {
     'kerberos': [
         'python-krbV',
-        'sasl']
+        'sasl'],
+    'crc32c': [
+        'crcmod'],
+    'test': [
+        'tox',
+        'virtualenv>=1.11.2']
 }
 
-tests_require = [
-    'tox',
-    'virtualenv>=1.11.2']
-
 setup(
     name='snakebite',
     version=version(),
@@ -62,7 +50,9 @@ setup(
     description='Pure Python HDFS client',
     url='http://github.com/spotify/snakebite',
     packages=['snakebite', 'snakebite.protobuf'],
-    scripts=['bin/snakebite'],
+    entry_points={
+        'console_scripts': ['snakebite = snakebite.cli:main']
+    },
     license='Apache License 2.0',
     keywords='hadoop protobuf hdfs'.split(),
     classifiers=[
@@ -77,8 +67,7 @@ setup(
         ('etc/bash_completion.d', ['scripts/snakebite-completion.bash']),
         ('', ['LICENSE'])
     ],
+    python_requires='>=2.7, <3',
     install_requires=install_requires,
-    extras_require=extras_require,
-    tests_require=tests_require,
-    cmdclass={'test': Tox}
+    extras_require=extras_require
 )
@@ -41,10 +41,13 @@ May 2012
 # Standard library imports
 import socket
 import os
-import math
+import array
+import sys
 
 # Third party imports
 from google.protobuf.service import RpcChannel
+from google.protobuf.internal import api_implementation
+from google.protobuf.descriptor import FieldDescriptor
 
 # Protobuf imports
 from snakebite.protobuf.RpcHeader_pb2 import RpcRequestHeaderProto, RpcResponseHeaderProto
@@ -55,10 +58,17 @@ from snakebite.protobuf.datatransfer_pb2 import OpReadBlockProto, BlockOpRespons
 from snakebite.platformutils import get_current_username
 from snakebite.formatter import format_bytes
 from snakebite.errors import RequestError, TransientException, FatalException
-from snakebite.crc32c import crc
+
+try:
+    # crcmod's C extension, if it is installed
+    import crcmod._crcfunext
+    import crcmod.predefined
+    crc = crcmod.predefined.mkPredefinedCrcFun('crc-32c')
+except ImportError:
+    from snakebite.crc32c import crc
 
 import google.protobuf.internal.encoder as encoder
-import google.protobuf.internal.decoder as decoder
+import google.protobuf.internal.wire_format as wire_format
 
 # Module imports
 
@@ -80,109 +90,230 @@ log = logger.getLogger(__name__)
 
 
 def log_protobuf_message(header, message):
-    log.debug("%s:\n\n\033[92m%s\033[0m" % (header, message))
+    log.debug("%s:\n\n\033[92m%s\033[0m", header, message)
 
 
-def get_delimited_message_bytes(byte_stream, nr=4):
-    ''' Parse a delimited protobuf message. This is done by first getting a protobuf varint from
-    the stream that represents the length of the message, then reading that amount of
-    from the message and then parse it.
-    Since the int can be represented as max 4 bytes, first get 4 bytes and try to decode.
-    The decoder returns the value and the position where the value was found, so we need
-    to rewind the buffer to the position, because the remaining bytes belong to the message
-    after.
-    '''
+# Lets recv wait for all requested bytes, where the platform supports it
+_MSG_WAITALL = getattr(socket, 'MSG_WAITALL', 0)
+
+# Precompiled structs for the fixed size (big endian) length fields
+_INT32 = struct.Struct("!i")
+_UINT32 = struct.Struct("!I")
+# Packet length and header size that start every data transfer packet
+_PACKET_LENGTHS = struct.Struct("!IH")
+
+# Varint length prefixes of the (mostly short) delimited messages we send
+_VARINT_BYTES = [encoder._VarintBytes(i) for i in xrange(256)]
+
+
+def varint_bytes(n):
+    if n < 256:
+        return _VARINT_BYTES[n]
+    return encoder._VarintBytes(n)
+
 
-    (length, pos) = decoder._DecodeVarint32(byte_stream.read(nr), 0)
-    if log.getEffectiveLevel() == logging.DEBUG:
-        log.debug("Delimited message length (pos %d): %d" % (pos, length))
+# Tag of RpcRequestHeaderProto.callId (field 3, a sint32)
+_CALL_ID_TAG = encoder.TagBytes(3, wire_format.WIRETYPE_VARINT)
 
-    delimiter_bytes = nr - pos
 
-    byte_stream.rewind(delimiter_bytes)
+def varint_size(n):
+    if n < 0x80:
+        return 1
+    elif n < 0x4000:
+        return 2
+    elif n < 0x200000:
+        return 3
+    elif n < 0x10000000:
+        return 4
+    return 5
+
+
+def get_delimited_message_bytes(byte_stream):
+    ''' Parse a delimited protobuf message. This is done by first reading the protobuf varint
+    from the stream that represents the length of the message, and then reading that amount
+    of bytes from the stream.
+    Returns the total number of bytes consumed (varint and message) and the message bytes.
+    '''
+
+    length = byte_stream.read_varint32()
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Delimited message length: %d", length)
+
     message_bytes = byte_stream.read(length)
-    if log.getEffectiveLevel() == logging.DEBUG:
-        log.debug("Delimited message bytes (%d): %s" % (len(message_bytes), format_bytes(message_bytes)))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Delimited message bytes (%d): %s", len(message_bytes), format_bytes(message_bytes))
 
-    total_len = length + pos
+    total_len = length + varint_size(length)
     return (total_len, message_bytes)
 
 
+def has_required_fields(descriptor, _seen=None):
+    '''Returns whether messages of the given type, or of a message type nested in it,
+    have required fields. Only then IsInitialized() can return False.
+    '''
+    if _seen is None:
+        _seen = set()
+    _seen.add(descriptor.full_name)
+    for field in descriptor.fields:
+        if field.label == FieldDescriptor.LABEL_REQUIRED:
+            return True
+        if field.type == FieldDescriptor.TYPE_MESSAGE and field.message_type.full_name not in _seen:
+            if has_required_fields(field.message_type, _seen):
+                return True
+    return False
+
+
 class RpcBufferedReader(object):
     '''Class that wraps a socket and provides some utility methods for reading
-    and rewinding of the buffer. This comes in handy when reading protobuf varints.
+    from it, including protobuf varints.
+
+    Bytes are received straight into a bytearray that grows as needed; write_pos
+    marks the end of the data received so far. With read_ahead, every recv asks
+    for up to RECV_SIZE bytes and whatever arrives beyond the requested bytes is
+    kept for the next reads, so only use it if nothing else reads from the socket.
     '''
-    MAX_READ_ATTEMPTS = 100
+    RECV_SIZE = 65536
+    # Buffers that grew beyond this (for a large response) aren't kept by reset
+    MAX_KEPT_BUFFER_SIZE = 16 * RECV_SIZE
 
-    def __init__(self, socket):
+    def __init__(self, socket, read_ahead=True):
         self.socket = socket
-        self.reset()
+        self.read_ahead = read_ahead
+        self.buffer = bytearray()
+        self.write_pos = 0
+        self.pos = -1  # position of last byte read
 
     def read(self, n):
         '''Reads n bytes into the internal buffer'''
-        bytes_wanted = n - self.buffer_length + self.pos + 1
-        if bytes_wanted > 0:
-            self._buffer_bytes(bytes_wanted)
+        start = self.pos + 1
+        end = start + n
+        if end > self.write_pos:
+            self._buffer_bytes(end - self.write_pos)
+
+        self.pos = end - 1
+        return memoryview(self.buffer)[start:end].tobytes()
+
+    def read_view(self, n):
+        '''Like read, but returns a memoryview on the internal buffer instead of a copy.
+        The view has to be dropped before the next read, because the buffer can't grow
+        while it's referenced.
+        '''
+        start = self.pos + 1
+        end = start + n
+        if end > self.write_pos:
+            self._buffer_bytes(end - self.write_pos)
 
-        end_pos = self.pos + n
-        ret = self.buffer[self.pos + 1:end_pos + 1]
-        self.pos = end_pos
-        return ret
+        self.pos = end - 1
+        return memoryview(self.buffer)[start:end]
+
+    def fill(self, n):
+        '''Makes sure the next n bytes are in the buffer, receiving whatever is
+        missing in one go, so reading them doesn't touch the socket.
+        '''
+        missing = self.pos + 1 + n - self.write_pos
+        if missing > 0:
+            self._buffer_bytes(missing)
 
     def _buffer_bytes(self, n):
+        if self.read_ahead:
+            self._reserve(max(n, self.RECV_SIZE))
+        else:
+            self._reserve(n)
+        view = memoryview(self.buffer)
         to_read = n
-        for _ in xrange(self.MAX_READ_ATTEMPTS):
-            bytes_read = self.socket.recv(to_read)
-            self.buffer += bytes_read
-            to_read -= len(bytes_read)
-            if to_read == 0:
-                log.debug("Bytes read: %d, total: %d" % (len(bytes_read), self.buffer_length))
-                return n
-        if len(bytes_read) < n:
-            # we'd like to distinguish transient (e.g. network-related) problems
-            # note: but this error could also be a logic error
-            raise TransientException("RpcBufferedReader only managed to read %s out of %s bytes" % (len(bytes_read), n))
-
-    def rewind(self, places):
-        '''Rewinds the current buffer to a position. Needed for reading varints,
-        because we might read bytes that belong to the stream after the varint.
+        while to_read > 0:
+            if self.read_ahead:
+                bytes_read = self.socket.recv_into(view[self.write_pos:])
+            else:
+                bytes_read = self.socket.recv_into(view[self.write_pos:], to_read, _MSG_WAITALL)
+            if bytes_read == 0:
+                # we'd like to distinguish transient (e.g. network-related) problems
+                # note: but this error could also be a logic error
+                raise TransientException("RpcBufferedReader only managed to read %s out of %s bytes" % (n - to_read, n))
+            self.write_pos += bytes_read
+            to_read -= bytes_read
+        log.debug("Bytes read: %d, total: %d", n - to_read, self.buffer_length)
+        return n
+
+    def _reserve(self, n):
+        '''Makes sure there's room for n more bytes after write_pos.'''
+        free = len(self.buffer) - self.write_pos
+        if free < n:
+            self.buffer.extend(bytearray(max(n - free, len(self.buffer))))
+
+    def read_varint32(self):
+        '''Reads a protobuf varint from the stream, one byte at a time, so nothing
+        after it is consumed.
         '''
-        log.debug("Rewinding pos %d with %d places" % (self.pos, places))
-        self.pos -= places
-        log.debug("Reset buffer to pos %d" % self.pos)
+        # Fast path: most lengths fit in a single byte
+        pos = self.pos + 1
+        if pos < self.write_pos:
+            byte = self.buffer[pos]
+            if not byte & 0x80:
+                self.pos = pos
+                return byte
+        result = 0
+        shift = 0
+        while shift < 35:
+            if self.pos + 1 >= self.write_pos:
+                self._buffer_bytes(1)
+            self.pos += 1
+            byte = self.buffer[self.pos]
+            result |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+        raise FatalException("Too many bytes when decoding varint")
 
     def reset(self):
-        self.buffer = ""
-        self.pos = -1  # position of last byte read
+        '''Discards the bytes that have been read, so the buffer can be reused for
+        the next message. Bytes that were received ahead are kept.
+        '''
+        unread = self.buffer[self.pos + 1:self.write_pos]
+        if len(self.buffer) > self.MAX_KEPT_BUFFER_SIZE:
+            self.buffer = unread
+        else:
+            self.buffer[:len(unread)] = unread
+        self.write_pos = len(unread)
+        self.pos = -1
 
     @property
     def buffer_length(self):
-        '''Returns the length of the current buffer.'''
-        return len(self.buffer)
+        '''Returns the length of the data in the current buffer.'''
+        return self.write_pos
 
 
 class SocketRpcChannel(RpcChannel):
-    ERROR_BYTES = 18446744073709551615L
-    RPC_HEADER = "hrpc"
+    RPC_HEADER = b"hrpc"
     RPC_SERVICE_CLASS = 0x00
     AUTH_PROTOCOL_NONE = 0x00
     AUTH_PROTOCOL_SASL = 0xDF
     RPC_PROTOCOL_BUFFFER = 0x02
+    # Per request class, whether it has any required fields to validate
+    _validated_classes = {}
+    # Warn only once per process about the pure python protobuf implementation
+    _protobuf_implementation_checked = False
 
 
     '''Socket implementation of an RpcChannel.
     '''
 
     def __init__(self, host, port, version, effective_user=None, use_sasl=False, hdfs_namenode_principal=None,
-                 sock_connect_timeout=10000, sock_request_timeout=10000):
+                 sock_connect_timeout=10000, sock_request_timeout=10000, sock_rcvbuf_size=None, sock_sndbuf_size=None,
+                 validate_requests=True):
         '''SocketRpcChannel to connect to a socket server on a user defined port.
-           It possible to define version and effective user for the communication.'''
+           It possible to define version and effective user for the communication.
+           sock_rcvbuf_size and sock_sndbuf_size set the kernel socket buffer sizes;
+           when None, the kernel's defaults (and its buffer autotuning) are kept.
+           With validate_requests=False, requests aren't checked for missing required
+           fields before they're sent; serializing such a request still fails.'''
         self.host = host
         self.port = port
         self.sock = None
+        self.reader = None
         self.call_id = -3  # First time (when the connection context is sent, the call_id should be -3, otherwise start with 0 and increment)
         self.version = version
-        self.client_id = str(uuid.uuid4())
+        self.client_id = uuid.uuid4().bytes  # 16 bytes, like the Java client's ClientId
         self.use_sasl = use_sasl
         self.hdfs_namenode_principal = hdfs_namenode_principal
         if self.use_sasl:
@@ -195,12 +326,29 @@ class SocketRpcChannel(RpcChannel):
             self.effective_user = effective_user or get_current_username()
         self.sock_connect_timeout = sock_connect_timeout
         self.sock_request_timeout = sock_request_timeout
+        self.sock_rcvbuf_size = sock_rcvbuf_size
+        self.sock_sndbuf_size = sock_sndbuf_size
+        self.validate_requests = validate_requests
+        # The preamble, connection context and request headers only depend on the
+        # channel (and method), so they're serialized once and reused
+        self.preamble = None
+        self.connection_context = None
+        self.request_headers = {}
+        self.rpc_request_header = None
+        # Reused for every response, ParseFromString clears it first
+        self.response_header = RpcResponseHeaderProto()
 
     def validate_request(self, request):
         '''Validate the client request against the protocol file.'''
 
+        request_class = type(request)
+        needs_validation = self._validated_classes.get(request_class)
+        if needs_validation is None:
+            needs_validation = has_required_fields(request.DESCRIPTOR)
+            self._validated_classes[request_class] = needs_validation
+
         # Check the request is correctly initialized
-        if not request.IsInitialized():
+        if needs_validation and not request.IsInitialized():
             raise FatalException("Client request (%s) is missing mandatory fields" % type(request))
 
     def get_connection(self, host, port):
@@ -226,24 +374,28 @@ class SocketRpcChannel(RpcChannel):
         '''
 
         log.debug("############## CONNECTING ##############")
+        self._check_protobuf_implementation()
         # Open socket
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.reader = None
         self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if self.sock_rcvbuf_size is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.sock_rcvbuf_size)
+        if self.sock_sndbuf_size is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sock_sndbuf_size)
         self.sock.settimeout(self.sock_connect_timeout / 1000)
         # Connect socket to server - defined by host and port arguments
         self.sock.connect((host, port))
         self.sock.settimeout(self.sock_request_timeout / 1000)
 
         # Send RPC headers
-        self.write(self.RPC_HEADER)                             # header
-        self.write(struct.pack('B', self.version))              # version
-        self.write(struct.pack('B', self.RPC_SERVICE_CLASS))    # RPC service class
-        if self.use_sasl:
-            self.write(struct.pack('B', self.AUTH_PROTOCOL_SASL))   # serialization type (protobuf = 0xDF)
-        else:
-            self.write(struct.pack('B', self.AUTH_PROTOCOL_NONE))   # serialization type (protobuf = 0)
+        preamble = self.create_preamble()
 
         if self.use_sasl:
+            # The preamble has to be sent before the SASL negotiation starts
+            self.write(preamble)
+            preamble = b""
             sasl = SaslRpcClient(self, hdfs_namenode_principal=self.hdfs_namenode_principal)
             sasl_connected = sasl.connect()
             if not sasl_connected:
@@ -252,52 +404,82 @@ class SocketRpcChannel(RpcChannel):
         rpc_header = self.create_rpc_request_header()
         context = self.create_connection_context()
 
-        header_length = len(rpc_header) + encoder._VarintSize(len(rpc_header)) +len(context) + encoder._VarintSize(len(context))
+        header_length = len(rpc_header) + varint_size(len(rpc_header)) + len(context) + varint_size(len(context))
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Header length: %s (%s)", header_length, format_bytes(_UINT32.pack(header_length)))
 
-        if log.getEffectiveLevel() == logging.DEBUG:
-            log.debug("Header length: %s (%s)" % (header_length, format_bytes(struct.pack('!I', header_length))))
+        self.write(b"".join([preamble,
+                             _UINT32.pack(header_length),
+                             varint_bytes(len(rpc_header)), rpc_header,
+                             varint_bytes(len(context)), context]))
 
-        self.write(struct.pack('!I', header_length))
+    @classmethod
+    def _check_protobuf_implementation(cls):
+        implementation = api_implementation.Type()
+        log.debug("Using the %s protobuf implementation", implementation)
+        if implementation == 'python' and not cls._protobuf_implementation_checked:
+            log.warning("Using the pure python protobuf implementation, which is a lot slower "
+                        "than the C++ one. See the README on how to switch.")
+        cls._protobuf_implementation_checked = True
 
-        self.write_delimited(rpc_header)
-        self.write_delimited(context)
-    
     def write(self, data):
-        if log.getEffectiveLevel() == logging.DEBUG:
+        if log.isEnabledFor(logging.DEBUG):
             log.debug("Sending: %s", format_bytes(data))
-        self.sock.send(data)
-
-    def write_delimited(self, data):
-        self.write(encoder._VarintBytes(len(data)))
-        self.write(data)
+        self.sock.sendall(data)
 
     def create_rpc_request_header(self):
-        '''Creates and serializes a delimited RpcRequestHeaderProto message.'''
-        rpcheader = RpcRequestHeaderProto()
-        rpcheader.rpcKind = 2  # rpcheaderproto.RpcKindProto.Value('RPC_PROTOCOL_BUFFER')
-        rpcheader.rpcOp = 0  # rpcheaderproto.RpcPayloadOperationProto.Value('RPC_FINAL_PACKET')
-        rpcheader.callId = self.call_id
-        rpcheader.retryCount = -1
-        rpcheader.clientId = self.client_id[0:16]
+        '''Creates and serializes a RpcRequestHeaderProto message (not delimited).'''
+        # Only the callId changes between calls, so the fields before and after it are
+        # serialized once, and the callId is encoded in between
+        if self.rpc_request_header is None:
+            head = RpcRequestHeaderProto()
+            head.rpcKind = 2  # rpcheaderproto.RpcKindProto.Value('RPC_PROTOCOL_BUFFER')
+            head.rpcOp = 0  # rpcheaderproto.RpcPayloadOperationProto.Value('RPC_FINAL_PACKET')
+            tail = RpcRequestHeaderProto()
+            tail.clientId = self.client_id
+            tail.retryCount = -1
+            self.rpc_request_header = (head.SerializePartialToString(), tail.SerializePartialToString())
+        (head, tail) = self.rpc_request_header
+        s_rpcHeader = b"".join([head, _CALL_ID_TAG, encoder._VarintBytes(wire_format.ZigZagEncode(self.call_id)), tail])
 
         if self.call_id == -3:
             self.call_id = 0
         else:
             self.call_id += 1
 
-        # Serialize delimited
-        s_rpcHeader = rpcheader.SerializeToString()
-        log_protobuf_message("RpcRequestHeaderProto (len: %d)" % (len(s_rpcHeader)), rpcheader)
+        if log.isEnabledFor(logging.DEBUG):
+            rpcheader = RpcRequestHeaderProto()
+            rpcheader.ParseFromString(s_rpcHeader)
+            log_protobuf_message("RpcRequestHeaderProto (len: %d)" % (len(s_rpcHeader)), rpcheader)
         return s_rpcHeader
 
+    def create_preamble(self):
+        '''Creates the connection preamble: RPC_HEADER, version, service class and
+        auth protocol. It's the same for every connection of the channel.'''
+        if self.preamble is not None:
+            return self.preamble
+
+        if self.use_sasl:
+            auth_protocol = self.AUTH_PROTOCOL_SASL   # serialization type (protobuf = 0xDF)
+        else:
+            auth_protocol = self.AUTH_PROTOCOL_NONE   # serialization type (protobuf = 0)
+        self.preamble = self.RPC_HEADER + struct.pack('BBB', self.version, self.RPC_SERVICE_CLASS, auth_protocol)
+        return self.preamble
+
     def create_connection_context(self):
         '''Creates and seriazlies a IpcConnectionContextProto (not delimited)'''
+        if self.connection_context is not None:
+            return self.connection_context
+
         context = IpcConnectionContextProto()
         context.userInfo.effectiveUser = self.effective_user
         context.protocol = "org.apache.hadoop.hdfs.protocol.ClientProtocol"
 
         s_context = context.SerializeToString()
-        log_protobuf_message("RequestContext (len: %d)" % len(s_context), context)
+        if log.isEnabledFor(logging.DEBUG):
+            log_protobuf_message("RequestContext (len: %d)" % len(s_context), context)
+        self.connection_context = s_context
         return s_context
 
     def send_rpc_message(self, method, request):
@@ -321,45 +503,58 @@ class SocketRpcChannel(RpcChannel):
         +---------------------------------------------------------------------+
         '''
         log.debug("############## SENDING ##############")
+        self.write(self.create_rpc_message(method, request))
 
+    def create_rpc_message(self, method, request):
+        '''Creates the serialized RPC request that send_rpc_message sends.'''
         #0. RpcRequestHeaderProto
         rpc_request_header = self.create_rpc_request_header()
         #1. RequestHeaderProto
         request_header = self.create_request_header(method)
         #2. Param
         param = request.SerializeToString()
-        if log.getEffectiveLevel() == logging.DEBUG:
+        if log.isEnabledFor(logging.DEBUG):
             log_protobuf_message("Request", request)
 
-        rpc_message_length = len(rpc_request_header) + encoder._VarintSize(len(rpc_request_header)) + \
-                             len(request_header) + encoder._VarintSize(len(request_header)) + \
-                             len(param) + encoder._VarintSize(len(param))
+        rpc_message_length = len(rpc_request_header) + varint_size(len(rpc_request_header)) + \
+                             len(request_header) + varint_size(len(request_header)) + \
+                             len(param) + varint_size(len(param))
 
-        if log.getEffectiveLevel() == logging.DEBUG:
-            log.debug("RPC message length: %s (%s)" % (rpc_message_length, format_bytes(struct.pack('!I', rpc_message_length))))
-        self.write(struct.pack('!I', rpc_message_length))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("RPC message length: %s (%s)", rpc_message_length, format_bytes(_UINT32.pack(rpc_message_length)))
 
-        self.write_delimited(rpc_request_header)
-        self.write_delimited(request_header)
-        self.write_delimited(param)
+        return b"".join([_UINT32.pack(rpc_message_length),
+                         varint_bytes(len(rpc_request_header)), rpc_request_header,
+                         varint_bytes(len(request_header)), request_header,
+                         varint_bytes(len(param)), param])
 
     def create_request_header(self, method):
+        s_header = self.request_headers.get(method.name)
+        if s_header is not None:
+            return s_header
+
         header = RequestHeaderProto()
         header.methodName = method.name
         header.declaringClassProtocolName = "org.apache.hadoop.hdfs.protocol.ClientProtocol"
         header.clientProtocolVersion = 1
 
         s_header = header.SerializeToString()
-        log_protobuf_message("RequestHeaderProto (len: %d)" % len(s_header), header)
+        if log.isEnabledFor(logging.DEBUG):
+            log_protobuf_message("RequestHeaderProto (len: %d)" % len(s_header), header)
+        self.request_headers[method.name] = s_header
         return s_header
 
     def recv_rpc_message(self):
         '''Handle reading an RPC reply from the server. This is done by wrapping the
-        socket in a RcpBufferedReader that allows for rewinding of the buffer stream.
+        socket in a RpcBufferedReader that buffers what is received from it.
+        The reader is reused for all replies on the same socket.
         '''
         log.debug("############## RECVING ##############")
-        byte_stream = RpcBufferedReader(self.sock)
-        return byte_stream
+        if self.reader is None:
+            self.reader = RpcBufferedReader(self.sock)
+        else:
+            self.reader.reset()
+        return self.reader
 
     def get_length(self, byte_stream):
         ''' In Hadoop protobuf RPC, some parts of the stream are delimited with protobuf varint,
@@ -368,8 +563,8 @@ class SocketRpcChannel(RpcChannel):
         and returning the first element from a tuple. The tuple that is returned from struc.unpack()
         only contains one element.
         '''
-        length = struct.unpack("!i", byte_stream.read(4))[0]
-        log.debug("4 bytes delimited part length: %d" % length)
+        length = _INT32.unpack(byte_stream.read_view(4))[0]
+        log.debug("4 bytes delimited part length: %d", length)
         return length
 
     def parse_response(self, byte_stream, response_class):
@@ -388,30 +583,42 @@ class SocketRpcChannel(RpcChannel):
         In case of an error, the header status is set to ERROR and the error fields are set.
         '''
 
+        (header, remaining) = self.parse_response_header(byte_stream)
+        return self.parse_response_body(byte_stream, header, remaining, response_class)
+
+    def parse_response_header(self, byte_stream):
+        '''Reads the length and RpcResponseHeaderProto of a response. Returns the header
+        and the number of bytes of the response that follow it.
+        '''
         log.debug("############## PARSING ##############")
-        log.debug("Payload class: %s" % response_class)
 
         # Read first 4 bytes to get the total length
-        len_bytes = byte_stream.read(4)
-        total_length = struct.unpack("!I", len_bytes)[0]
-        log.debug("Total response length: %s" % total_length)
+        total_length = _UINT32.unpack(byte_stream.read_view(4))[0]
+        log.debug("Total response length: %s", total_length)
+        # Get the whole response at once, it's parsed from the buffer
+        byte_stream.fill(total_length)
 
-        header = RpcResponseHeaderProto()
+        header = self.response_header
         (header_len, header_bytes) = get_delimited_message_bytes(byte_stream)
 
-        log.debug("Header read %d" % header_len)
+        log.debug("Header read %d", header_len)
         header.ParseFromString(header_bytes)
-        log_protobuf_message("RpcResponseHeaderProto", header)
-
+        if log.isEnabledFor(logging.DEBUG):
+            log_protobuf_message("RpcResponseHeaderProto", header)
+        log.debug("header: %s, total: %s", header_len, total_length)
+        return (header, total_length - header_len)
+
+    def parse_response_body(self, byte_stream, header, remaining, response_class):
+        '''Parses the response that follows the given header, or raises its error.'''
+        log.debug("Payload class: %s", response_class)
         if header.status == 0:
-            log.debug("header: %s, total: %s" % (header_len, total_length))
-            if header_len >= total_length:
+            if remaining <= 0:
                 return
             response = response_class()
-            response_bytes = get_delimited_message_bytes(byte_stream, total_length - header_len)[1]
+            response_bytes = get_delimited_message_bytes(byte_stream)[1]
             if len(response_bytes) > 0:
                 response.ParseFromString(response_bytes)
-                if log.getEffectiveLevel() == logging.DEBUG:
+                if log.isEnabledFor(logging.DEBUG):
                     log_protobuf_message("Response", response)
                 return response
         else:
@@ -430,14 +637,17 @@ class SocketRpcChannel(RpcChannel):
                 pass
 
             self.sock = None
+            self.reader = None
 
     def CallMethod(self, method, controller, request, response_class, done):
         '''Call the RPC method. The naming doesn't confirm PEP8, since it's
         a method called by protobuf
         '''
-        try:
+        # An invalid request is rejected before anything is sent, so the connection stays usable
+        if self.validate_requests:
             self.validate_request(request)
 
+        try:
             if not self.sock:
                 self.get_connection(self.host, self.port)
 
@@ -447,14 +657,60 @@ class SocketRpcChannel(RpcChannel):
             return self.parse_response(byte_stream, response_class)
         except RequestError:  # Raise a request error, but don't close the socket
             raise
-        except Exception:  # All other errors close the socket
+        except Exception:  # All other errors close the socket, the stream might be out of sync
             self.close_socket()
             raise
 
+    def call_many(self, calls):
+        '''Pipelines RPC calls: all requests are sent at once, and only then the responses
+        are read, so the calls cost one round trip instead of one each. calls is a list
+        of (method, request, response_class) tuples, like the arguments of CallMethod.
+
+        Returns the responses in the order of the calls. The NameNode may answer out of
+        order, so responses are matched to their calls by callId. If calls fail, the
+        error of the first failed call is raised once all responses have been read.
+        '''
+        if self.validate_requests:
+            for (_, request, _) in calls:
+                self.validate_request(request)
+
+        try:
+            if not self.sock:
+                self.get_connection(self.host, self.port)
+
+            pending = {}
+            messages = []
+            for (index, (method, request, _)) in enumerate(calls):
+                pending[self.call_id] = index
+                messages.append(self.create_rpc_message(method, request))
+            log.debug("############## SENDING %d ##############", len(messages))
+            self.write(b"".join(messages))
+
+            responses = [None] * len(calls)
+            errors = [None] * len(calls)
+            while pending:
+                byte_stream = self.recv_rpc_message()
+                (header, remaining) = self.parse_response_header(byte_stream)
+                index = pending.pop(header.callId, None)
+                if index is None:
+                    raise FatalException("Unexpected response for call %d" % header.callId)
+                try:
+                    responses[index] = self.parse_response_body(byte_stream, header, remaining, calls[index][2])
+                except RequestError as e:
+                    errors[index] = e
+        except Exception:  # The stream might be out of sync, close the socket
+            self.close_socket()
+            raise
+
+        for error in errors:
+            if error is not None:
+                raise error
+        return responses
+
 
 class DataXceiverChannel(object):
-    # For internal reading: should be larger than bytes_per_chunk
-    LOAD_SIZE = 16000.0
+    # Data transfer protocol version
+    DATA_TRANSFER_VERSION = 28
 
     # Op codes
     WRITE_BLOCK = 80
@@ -465,6 +721,9 @@ class DataXceiverChannel(object):
     BLOCK_CHECKSUM = 85
     TRANSFER_BLOCK = 86
 
+    # Version and op code in front of every read block request
+    READ_BLOCK_HEADER = struct.pack('>hb', DATA_TRANSFER_VERSION, READ_BLOCK)
+
     # Checksum types
     CHECKSUM_NULL = 0
     CHECKSUM_CRC32 = 1
@@ -472,43 +731,48 @@ class DataXceiverChannel(object):
     CHECKSUM_DEFAULT = 3
     CHECKSUM_MIXED = 4
 
-    MAX_READ_ATTEMPTS = 100
-
-    def __init__(self, host, port):
+    def __init__(self, host, port, sock_rcvbuf_size=None):
         self.host, self.port = host, port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Only override the kernel's receive buffer (and its autotuning) when asked to
+        if sock_rcvbuf_size is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, sock_rcvbuf_size)
 
     def connect(self):
         try:
             self.sock.connect((self.host, self.port))
-            log.debug("%s connected to DataNode" % self)
+            log.debug("%s connected to DataNode", self)
             return True
         except Exception:
-            log.debug("%s connection to DataNode failed" % self)
+            log.debug("%s connection to DataNode failed", self)
             return False
 
     def _close_socket(self):
         self.sock.close()
 
-    def _read_bytes(self, n, depth=0):
-        if depth > self.MAX_READ_ATTEMPTS:
-            raise TransientException("Tried to read %d more bytes, but failed after %d attempts" % (n, self.MAX_READ_ATTEMPTS))
-
-        bytes = self.sock.recv(n)
-        if len(bytes) < n:
-            left = n - len(bytes)
-            depth += 1
-            bytes += self._read_bytes(left, depth)
-        return bytes
+    def _read_bytes(self, n):
+        buf = bytearray(n)
+        self._read_into(memoryview(buf))
+        return bytes(buf)
+
+    def _read_into(self, view):
+        '''Fill the given memoryview with bytes from the socket'''
+        n = len(view)
+        read = 0
+        while read < n:
+            bytes_read = self.sock.recv_into(view[read:], n - read, _MSG_WAITALL)
+            if bytes_read == 0:
+                raise TransientException("Connection closed after reading %d out of %d bytes" % (read, n))
+            read += bytes_read
 
     def write(self, data):
-        if log.getEffectiveLevel() == logging.DEBUG:
+        if log.isEnabledFor(logging.DEBUG):
             log.debug("Sending: %s", format_bytes(data))
-        self.sock.send(data)
+        self.sock.sendall(data)
 
     def write_delimited(self, data):
-        self.write(encoder._VarintBytes(len(data)))
-        self.write(data)
+        self.write(varint_bytes(len(data)) + data)
 
     def readBlock(self, length, pool_id, block_id, generation_stamp, offset, block_token, check_crc):
         '''Send a read request to given block. If we receive a successful response,
@@ -542,11 +806,9 @@ class DataXceiverChannel(object):
         +---------------------------------------------------------------------+
 
         '''
-        log.debug("%s sending readBlock request" % self)
+        debug = log.isEnabledFor(logging.DEBUG)
+        log.debug("%s sending readBlock request", self)
 
-        # Send version and opcode
-        self.sock.send(struct.pack('>h', 28))
-        self.sock.send(struct.pack('b', self.READ_BLOCK))
         length = length - offset
 
         # Create and send OpReadBlockProto message
@@ -568,19 +830,25 @@ class DataXceiverChannel(object):
         block.blockId = block_id
         block.generationStamp = generation_stamp
         s_request = request.SerializeToString()
-        log_protobuf_message("OpReadBlockProto:", request)
-        self.write_delimited(s_request)
+        if debug:
+            log_protobuf_message("OpReadBlockProto:", request)
 
-        byte_stream = RpcBufferedReader(self.sock)
+        # Send version, opcode and request at once
+        self.write(b"".join([self.READ_BLOCK_HEADER,
+                             varint_bytes(len(s_request)), s_request]))
+
+        # Packets are read from the socket directly, so don't read ahead
+        byte_stream = RpcBufferedReader(self.sock, read_ahead=False)
         block_op_response_bytes = get_delimited_message_bytes(byte_stream)[1]
 
         block_op_response = BlockOpResponseProto()
         block_op_response.ParseFromString(block_op_response_bytes)
-        log_protobuf_message("BlockOpResponseProto", block_op_response)
+        if debug:
+            log_protobuf_message("BlockOpResponseProto", block_op_response)
 
         checksum_type = block_op_response.readOpChecksumInfo.checksum.type
         bytes_per_chunk = block_op_response.readOpChecksumInfo.checksum.bytesPerChecksum
-        log.debug("Checksum type: %s, bytesPerChecksum: %s" % (checksum_type, bytes_per_chunk))
+        log.debug("Checksum type: %s, bytesPerChecksum: %s", checksum_type, bytes_per_chunk)
         if checksum_type in [self.CHECKSUM_NULL]:
             checksum_len = 0
         elif checksum_type in [self.CHECKSUM_CRC32C, self.CHECKSUM_CRC32]:
@@ -588,68 +856,77 @@ class DataXceiverChannel(object):
         else:
             raise FatalException("Checksum type %s not implemented" % checksum_type)
 
+        # Header, checksums and data of a packet are received into one buffer, which
+        # is reused (and grown when needed) for all packets of the block
+        packet = bytearray()
+        packet_view = memoryview(packet)
+
+        # Reused for every packet, ParseFromString clears it first
+        packet_header = PacketHeaderProto()
         total_read = 0
+
+        # Loop invariants and methods used for every packet, bound once
+        verify_crc = check_crc and checksum_type != self.CHECKSUM_NULL
+        swap_checksums = sys.byteorder == 'little'
+        read_bytes = self._read_bytes
+        read_into = self._read_into
+        unpack_lengths = _PACKET_LENGTHS.unpack
         if block_op_response.status == 0:  # datatransfer_proto.Status.Value('SUCCESS')
             while total_read < length:
-                log.debug("== Reading next packet")
-
-                packet_len = struct.unpack("!I", byte_stream.read(4))[0]
-                log.debug("Packet length: %s", packet_len)
-
-                serialized_size = struct.unpack("!H", byte_stream.read(2))[0]
-                log.debug("Serialized size: %s", serialized_size)
-
-                packet_header_bytes = byte_stream.read(serialized_size)
-                packet_header = PacketHeaderProto()
-                packet_header.ParseFromString(packet_header_bytes)
-                log_protobuf_message("PacketHeaderProto", packet_header)
+                if debug:
+                    log.debug("== Reading next packet")
+
+                (packet_len, serialized_size) = unpack_lengths(read_bytes(6))
+                if debug:
+                    log.debug("Packet length: %s", packet_len)
+                    log.debug("Serialized size: %s", serialized_size)
+
+                # The packet length counts its own 4 bytes, the header, checksums and
+                # data follow it, so receive all of them in one go
+                packet_size = serialized_size + packet_len - 4
+                if len(packet) < packet_size:
+                    packet = bytearray(packet_size)
+                    packet_view = memoryview(packet)
+                read_into(packet_view[:packet_size])
+
+                packet_header.ParseFromString(packet_view[:serialized_size].tobytes())
+                if debug:
+                    log_protobuf_message("PacketHeaderProto", packet_header)
 
                 data_len = packet_header.dataLen
 
-                chunks_per_packet = int((data_len + bytes_per_chunk - 1) / bytes_per_chunk)
-                log.debug("Nr of chunks: %d", chunks_per_packet)
-
-                data_len = packet_len - 4 - chunks_per_packet * checksum_len
-                log.debug("Payload len: %d", data_len)
-
-                byte_stream.reset()
-
-                # Collect checksums
-                if check_crc and checksum_type != self.CHECKSUM_NULL:
-                    checksums = []
-                    for _ in xrange(0, chunks_per_packet):
-                        checksum = self._read_bytes(checksum_len)
-                        checksum = struct.unpack("!I", checksum)[0]
-                        checksums.append(checksum)
-                else:
-                    self._read_bytes(checksum_len * chunks_per_packet)
-
-                # We use a fixed size buffer (a "load") to read only a couple of chunks at once. 
-                bytes_per_load = self.LOAD_SIZE - (self.LOAD_SIZE % bytes_per_chunk)
-                chunks_per_load = int(bytes_per_load / bytes_per_chunk)
-                loads_per_packet = int(math.ceil(bytes_per_chunk * chunks_per_packet / bytes_per_load))
-
-                read_on_packet = 0
-                for i in range(loads_per_packet):
-                    load = ''
-                    for j in range(chunks_per_load):
-                        log.debug("Reading chunk %s in load %s:", j, i)
-                        bytes_to_read = min(bytes_per_chunk, data_len - read_on_packet)
-                        chunk = self._read_bytes(bytes_to_read)
-                        if check_crc and checksum_type != self.CHECKSUM_NULL:
-                            checksum_index = i * chunks_per_load + j
-                            if checksum_index < len(checksums) and crc(chunk) != checksums[checksum_index]:
-                                # it makes sense to retry, so TransientError
-                                raise TransientException("Checksum doesn't match")
-                        load += chunk
-                        total_read += len(chunk)
-                        read_on_packet += len(chunk)
-                    yield load
+                chunks_per_packet = (data_len + bytes_per_chunk - 1) // bytes_per_chunk
+                if debug:
+                    log.debug("Nr of chunks: %d", chunks_per_packet)
+
+                data_start = serialized_size + checksum_len * chunks_per_packet
+                data_len = packet_size - data_start
+                if debug:
+                    log.debug("Payload len: %d", data_len)
+
+                # Verify the checksums of all chunks before handing out the packet's data
+                if verify_crc:
+                    checksums = array.array('I', packet_view[serialized_size:data_start].tobytes())
+                    if swap_checksums:
+                        checksums.byteswap()
+                    chunk_start = data_start
+                    for checksum in checksums:
+                        chunk_end = min(chunk_start + bytes_per_chunk, packet_size)
+                        # A read-only buffer over the chunk, which crcmod takes
+                        # (it doesn't take bytearrays) without copying the data
+                        if crc(buffer(packet, chunk_start, chunk_end - chunk_start)) != checksum:
+                            # it makes sense to retry, so TransientError
+                            raise TransientException("Checksum doesn't match")
+                        chunk_start = chunk_end
+
+                total_read += data_len
+                yield packet_view[data_start:packet_size].tobytes()
            
             # Send ClientReadStatusProto message confirming successful read
             request = ClientReadStatusProto()
             request.status = 0  # SUCCESS
-            log_protobuf_message("ClientReadStatusProto:", request)
+            if debug:
+                log_protobuf_message("ClientReadStatusProto:", request)
             s_request = request.SerializeToString()
             self.write_delimited(s_request)
             self._close_socket()
@@ -32,6 +32,7 @@ from snakebite.namenode import Namenode
 from snakebite.service import RpcService
 
 import Queue
+import collections
 import zlib
 import bz2
 import logging
@@ -40,6 +41,7 @@ import os.path
 import posixpath
 import fnmatch
 import inspect
+import operator
 import socket
 import errno
 import time
@@ -52,6 +54,12 @@ if sys.version_info[0] == 3:
 
 log = logging.getLogger(__name__)
 
+# An RPC a processor wants to make, run later in a pipelined batch (see Client.async_rpc)
+_PendingCall = collections.namedtuple('_PendingCall', ['method_name', 'request', 'result'])
+# Yielded by _find_items to have _run_pending run the pending calls before a
+# directory whose own call is among them gets listed
+_FLUSH_PENDING = object()
+
 
 class Client(object):
     ''' A pure python HDFS client.
@@ -85,10 +93,13 @@ class Client(object):
         2: "f",
         3: "s"
     }
+    # Max number of calls async_rpc (and file info prefetching) pipelines at once
+    ASYNC_RPC_WINDOW = 64
 
     def __init__(self, host, port=Namenode.DEFAULT_PORT, hadoop_version=Namenode.DEFAULT_VERSION,
                  use_trash=False, effective_user=None, use_sasl=False, hdfs_namenode_principal=None,
-                 sock_connect_timeout=10000, sock_request_timeout=10000, use_datanode_hostname=False):
+                 sock_connect_timeout=10000, sock_request_timeout=10000, use_datanode_hostname=False,
+                 async_rpc=False, sock_rcvbuf_size=None, sock_sndbuf_size=None, validate_requests=True):
         '''
         :param host: Hostname or IP address of the NameNode
         :type host: string
@@ -110,6 +121,18 @@ class Client(object):
         :type sock_request_timeout: int
         :param use_datanode_hostname: Use hostname instead of IP address to commuicate with datanodes
         :type use_datanode_hostname: boolean
+        :param async_rpc: Pipeline the RPCs of chmod, chown, chgrp and setrep, up to ASYNC_RPC_WINDOW at a time.
+            When a call fails, its error is raised once the rest of its window has been run, and the results of the
+            window's successful calls are dropped, although those changes were made. With recurse, the calls made
+            so far are run before a directory is listed, so a directory is changed before its children are listed.
+            A path that doesn't exist raises its error after the calls for the paths before it have been run.
+        :type async_rpc: boolean
+        :param sock_rcvbuf_size: Kernel receive buffer size of the NameNode and DataNode sockets in bytes (default: None - kernel default)
+        :type sock_rcvbuf_size: int
+        :param sock_sndbuf_size: Kernel send buffer size of the NameNode socket in bytes (default: None - kernel default)
+        :type sock_sndbuf_size: int
+        :param validate_requests: Check requests for missing required fields before sending them
+        :type validate_requests: boolean
         '''
         if hadoop_version < 9:
             raise FatalException("Only protocol versions >= 9 supported")
@@ -121,13 +144,17 @@ class Client(object):
         self.service_stub_class = client_proto.ClientNamenodeProtocol_Stub
         self.service = RpcService(self.service_stub_class, self.port, self.host, hadoop_version,
                                   effective_user,self.use_sasl, self.hdfs_namenode_principal,
-                                  sock_connect_timeout, sock_request_timeout)
+                                  sock_connect_timeout, sock_request_timeout,
+                                  sock_rcvbuf_size=sock_rcvbuf_size, sock_sndbuf_size=sock_sndbuf_size,
+                                  validate_requests=validate_requests)
         self.use_trash = use_trash
         self.trash = self._join_user_path(".Trash")
         self._server_defaults = None
         self.use_datanode_hostname = use_datanode_hostname
+        self.async_rpc = async_rpc
+        self.sock_rcvbuf_size = sock_rcvbuf_size
 
-        log.debug("Created client for %s:%s with trash=%s and sasl=%s" % (host, port, use_trash, use_sasl))
+        log.debug("Created client for %s:%s with trash=%s and sasl=%s", host, port, use_trash, use_sasl)
 
     def ls(self, paths, recurse=False, include_toplevel=False, include_children=True):
         ''' Issues 'ls' command and returns a list of maps that contain fileinfo
@@ -165,24 +192,22 @@ class Client(object):
         for item in self._find_items(paths, self._handle_ls,
                                      include_toplevel=include_toplevel,
                                      include_children=include_children,
-                                     recurse=recurse):
+                                     recurse=recurse, prefetch_file_info=True):
             if item:
                 yield item
 
     LISTING_ATTRIBUTES = ['length', 'owner', 'group', 'block_replication',
                           'modification_time', 'access_time', 'blocksize']
+    _get_listing_attributes = operator.attrgetter(*LISTING_ATTRIBUTES)
 
     def _handle_ls(self, path, node):
         ''' Handle every node received for an ls request'''
-        entry = {}
+        entry = dict(zip(self.LISTING_ATTRIBUTES, self._get_listing_attributes(node)))
 
         entry["file_type"] = self.FILETYPES[node.fileType]
         entry["permission"] = node.permission.perm
         entry["path"] = path
 
-        for attribute in self.LISTING_ATTRIBUTES:
-            entry[attribute] = node.__getattribute__(attribute)
-
         return entry
 
     def chmod(self, paths, mode, recurse=False):
@@ -205,8 +230,8 @@ class Client(object):
             raise InvalidInputException("chmod: no mode given")
 
         processor = lambda path, node, mode=mode: self._handle_chmod(path, node, mode)
-        for item in self._find_items(paths, processor, include_toplevel=True,
-                                     include_children=False, recurse=recurse):
+        for item in self._run_pending(self._find_items(paths, processor, include_toplevel=True,
+                                                       include_children=False, recurse=recurse)):
             if item:
                 yield item
 
@@ -214,8 +239,7 @@ class Client(object):
         request = client_proto.SetPermissionRequestProto()
         request.src = path
         request.permission.perm = mode
-        self.service.setPermission(request)
-        return {"result": True, "path": path}
+        return self._call("setPermission", request, lambda response: {"result": True, "path": path})
 
     def chown(self, paths, owner, recurse=False):
         ''' Change the owner for paths. The owner can be specified as `user` or `user:group`
@@ -237,8 +261,8 @@ class Client(object):
             raise InvalidInputException("chown: no owner given")
 
         processor = lambda path, node, owner=owner: self._handle_chown(path, node, owner)
-        for item in self._find_items(paths, processor, include_toplevel=True,
-                                     include_children=False, recurse=recurse):
+        for item in self._run_pending(self._find_items(paths, processor, include_toplevel=True,
+                                                       include_children=False, recurse=recurse)):
             if item:
                 yield item
 
@@ -254,8 +278,7 @@ class Client(object):
             request.username = owner
         if group:
             request.groupname = group
-        self.service.setOwner(request)
-        return {"result": True, "path": path}
+        return self._call("setOwner", request, lambda response: {"result": True, "path": path})
 
     def chgrp(self, paths, group, recurse=False):
         ''' Change the group of paths.
@@ -278,8 +301,8 @@ class Client(object):
 
         owner = ":%s" % group
         processor = lambda path, node, owner=owner: self._handle_chown(path, node, owner)
-        for item in self._find_items(paths, processor, include_toplevel=True,
-                                     include_children=False, recurse=recurse):
+        for item in self._run_pending(self._find_items(paths, processor, include_toplevel=True,
+                                                       include_children=False, recurse=recurse)):
             if item:
                 yield item
 
@@ -302,19 +325,19 @@ class Client(object):
             raise InvalidInputException("count: no path given")
 
         for item in self._find_items(paths, self._handle_count, include_toplevel=True,
-                                     include_children=False, recurse=False):
+                                     include_children=False, recurse=False, prefetch_file_info=True):
             if item:
                 yield item
 
     COUNT_ATTRIBUTES = ['length', 'fileCount', 'directoryCount', 'quota', 'spaceConsumed', 'spaceQuota']
+    _get_count_attributes = operator.attrgetter(*COUNT_ATTRIBUTES)
 
     def _handle_count(self, path, node):
         request = client_proto.GetContentSummaryRequestProto()
         request.path = path
         response = self.service.getContentSummary(request)
-        entry = {"path": path}
-        for attribute in self.COUNT_ATTRIBUTES:
-            entry[attribute] = response.summary.__getattribute__(attribute)
+        entry = dict(zip(self.COUNT_ATTRIBUTES, self._get_count_attributes(response.summary)))
+        entry["path"] = path
         return entry
 
     def df(self):
@@ -330,13 +353,15 @@ class Client(object):
         processor = lambda path, node: self._handle_df(path, node)
         return list(self._find_items(['/'], processor, include_toplevel=True, include_children=False, recurse=False))[0]
 
+    DF_ATTRIBUTES = ['capacity', 'used', 'remaining', 'under_replicated',
+                     'corrupt_blocks', 'missing_blocks']
+    _get_df_attributes = operator.attrgetter(*DF_ATTRIBUTES)
+
     def _handle_df(self, path, node):
         request = client_proto.GetFsStatusRequestProto()
         response = self.service.getFsStats(request)
-        entry = {"filesystem": "hdfs://%s:%d" % (self.host, self.port)}
-        for i in ['capacity', 'used', 'remaining', 'under_replicated',
-                  'corrupt_blocks', 'missing_blocks']:
-            entry[i] = response.__getattribute__(i)
+        entry = dict(zip(self.DF_ATTRIBUTES, self._get_df_attributes(response)))
+        entry["filesystem"] = "hdfs://%s:%d" % (self.host, self.port)
         return entry
 
     def du(self, paths, include_toplevel=False, include_children=True):
@@ -370,7 +395,8 @@ class Client(object):
 
         processor = lambda path, node: self._handle_du(path, node)
         for item in self._find_items(paths, processor, include_toplevel=include_toplevel,
-                                     include_children=include_children, recurse=False):
+                                     include_children=include_children, recurse=False,
+                                     prefetch_file_info=True):
             if item:
                 yield item
 
@@ -662,8 +688,8 @@ class Client(object):
             raise InvalidInputException("setrep: no replication given")
 
         processor = lambda path, node, replication=replication: self._handle_setrep(path, node, replication)
-        for item in self._find_items(paths, processor, include_toplevel=True,
-                                     include_children=False, recurse=recurse):
+        for item in self._run_pending(self._find_items(paths, processor, include_toplevel=True,
+                                                       include_children=False, recurse=recurse)):
             if item:
                 yield item
 
@@ -672,8 +698,8 @@ class Client(object):
             request = client_proto.SetReplicationRequestProto()
             request.src = path
             request.replication = replication
-            response = self.service.setReplication(request)
-            return {"result": response.result, "path": path}
+            return self._call("setReplication", request,
+                              lambda response: {"result": response.result, "path": path})
 
     def cat(self, paths, check_crc=False):
         ''' Fetch all files that match the source file pattern
@@ -692,7 +718,7 @@ class Client(object):
 
         processor = lambda path, node, check_crc=check_crc: self._handle_cat(path, node, check_crc)
         for item in self._find_items(paths, processor, include_toplevel=True,
-                                     include_children=False, recurse=False):
+                                     include_children=False, recurse=False, prefetch_file_info=True):
             if item:
                 yield item
 
@@ -968,7 +994,7 @@ class Client(object):
 
         processor = lambda path, node, check_crc=check_crc: self._handle_text(path, node, check_crc)
         for item in self._find_items(paths, processor, include_toplevel=True,
-                                     include_children=False, recurse=False):
+                                     include_children=False, recurse=False, prefetch_file_info=True):
             if item:
                 yield item
 
@@ -1148,7 +1174,7 @@ class Client(object):
                 location = locations_queue.get()[1]
                 host = location.id.hostName if self.use_datanode_hostname else location.id.ipAddr
                 port = int(location.id.xferPort)
-                data_xciever = DataXceiverChannel(host, port)
+                data_xciever = DataXceiverChannel(host, port, self.sock_rcvbuf_size)
                 if data_xciever.connect():
                     try:
                         for load in data_xciever.readBlock(length, pool_id, block.b.blockId, block.b.generationStamp, offset_in_block, block_token, check_crc):
@@ -1171,7 +1197,8 @@ class Client(object):
             if successful_read is False:
                 raise TransientException("Failure to read block %s" % block.b.blockId)
 
-    def _find_items(self, paths, processor, include_toplevel=False, include_children=False, recurse=False, check_nonexistence=False):
+    def _find_items(self, paths, processor, include_toplevel=False, include_children=False, recurse=False,
+                    check_nonexistence=False, prefetch_file_info=False):
         ''' Request file info from the NameNode and call the processor on the node(s) returned
 
         :param paths:
@@ -1189,6 +1216,11 @@ class Client(object):
             Example: listing a directory should include children, but chmod shouldn't.
         :param recurse:
             Recurse into children if they are directories.
+        :param prefetch_file_info:
+            Request the file info of the (non glob) paths in pipelined windows of up to
+            ASYNC_RPC_WINDOW paths, one round trip per window instead of one per path.
+            Only for processors that don't modify the paths, since the file info can be
+            stale by the time it's used.
         '''
 
         if not paths:
@@ -1197,21 +1229,40 @@ class Client(object):
         # Expand paths if necessary (/foo/{bar,baz} --> ['/foo/bar', '/foo/baz'])
         paths = glob.expand_paths(paths)
 
+        normalized_paths = []
         for path in paths:
             if not path.startswith("/"):
                 path = self._join_user_path(path)
 
             # Normalize path (remove double /, handle '..', remove trailing /, etc)
-            path = self._normalize_path(path)
+            normalized_paths.append(self._normalize_path(path))
 
-            log.debug("Trying to find path %s" % path)
+        fileinfos = {}
+        prefetched = 0
+        for index, path in enumerate(normalized_paths):
+            log.debug("Trying to find path %s", path)
 
             if glob.has_magic(path):
-                log.debug("Dealing with globs in %s" % path)
+                log.debug("Dealing with globs in %s", path)
                 for item in self._glob_find(path, processor, include_toplevel):
                     yield item
             else:
-                fileinfo = self._get_file_info(path)
+                if prefetch_file_info and index >= prefetched:
+                    # Fetch the next window only once the loop gets to it, so the
+                    # results of the earlier paths are out before a later path fails
+                    prefetched = index + self.ASYNC_RPC_WINDOW
+                    window = [p for p in normalized_paths[index:prefetched] if not glob.has_magic(p)]
+                    if len(window) > 1:
+                        try:
+                            fileinfos.update(zip(window, self._get_file_infos(window)))
+                        except RequestError:
+                            # Request the window's paths one by one instead, so the
+                            # error is raised when its own path is reached
+                            log.debug("Prefetching file info failed, requesting it per path")
+                if path in fileinfos:
+                    fileinfo = fileinfos[path]
+                else:
+                    fileinfo = self._get_file_info(path)
                 if not fileinfo and not check_nonexistence:
                     raise FileNotFoundException("`%s': No such file or directory" % path)
                 elif not fileinfo and check_nonexistence:
@@ -1221,14 +1272,18 @@ class Client(object):
                     yield {"path": path, "result": False, "error": "File already exists"}
                     continue
 
+                entry = None
                 if (include_toplevel and fileinfo) or not self._is_dir(fileinfo.fs):
                     # Construct the full path before processing
                     full_path = self._get_full_path(path, fileinfo.fs)
-                    log.debug("Added %s to to result set" % full_path)
+                    log.debug("Added %s to to result set", full_path)
                     entry = processor(full_path, fileinfo.fs)
                     yield entry
 
                 if self._is_dir(fileinfo.fs) and (include_children or recurse):
+                    if isinstance(entry, _PendingCall):
+                        # Change the directory before listing it, like without async_rpc
+                        yield _FLUSH_PENDING
                     for node in self._get_dir_listing(path):
                         full_path = self._get_full_path(path, node)
                         entry = processor(full_path, node)
@@ -1236,6 +1291,8 @@ class Client(object):
 
                         # Recurse into directories
                         if recurse and self._is_dir(node):
+                            if isinstance(entry, _PendingCall):
+                                yield _FLUSH_PENDING
                             # Construct the full path before processing
                             full_path = posixpath.join(path, node.path)
                             for item in self._find_items([full_path],
@@ -1341,6 +1398,71 @@ class Client(object):
         request.src = path
         return self.service.getFileInfo(request)
 
+    def _call(self, method_name, request, result):
+        '''Calls a NameNode method for a processor and returns result(response). With
+        async_rpc, a _PendingCall is returned instead, which _run_pending runs.'''
+        if self.async_rpc:
+            return _PendingCall(method_name, request, result)
+        return result(getattr(self.service, method_name)(request))
+
+    def _run_pending(self, items):
+        '''Passes items through, but runs the _PendingCalls among them in pipelined
+        batches of up to ASYNC_RPC_WINDOW calls, and yields their results instead.
+        A batch is also run early when _FLUSH_PENDING comes by, or when getting the
+        next item fails. The order of the items is kept. When a call fails, its error
+        is raised after the rest of its batch has been run.'''
+        batch = []
+        calls = 0
+        items = iter(items)
+        while True:
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            except Exception:
+                # E.g. a path that doesn't exist: make the calls for the items before
+                # it first, as they would have been made without async_rpc
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                for result in self._finish_pending(batch):
+                    yield result
+                raise exc_type, exc_value, exc_traceback
+            if item is _FLUSH_PENDING:
+                for result in self._finish_pending(batch):
+                    yield result
+                batch = []
+                calls = 0
+                continue
+            if isinstance(item, _PendingCall):
+                calls += 1
+            elif not calls:
+                yield item
+                continue
+            batch.append(item)
+            if calls == self.ASYNC_RPC_WINDOW:
+                for result in self._finish_pending(batch):
+                    yield result
+                batch = []
+                calls = 0
+        for result in self._finish_pending(batch):
+            yield result
+
+    def _finish_pending(self, batch):
+        pending = [item for item in batch if isinstance(item, _PendingCall)]
+        if not pending:
+            return batch
+        responses = iter(self.service.call_many([(call.method_name, call.request) for call in pending]))
+        return [item.result(next(responses)) if isinstance(item, _PendingCall) else item for item in batch]
+
+    def _get_file_infos(self, paths):
+        '''Like _get_file_info for several paths, with the requests pipelined so they
+        take a single round trip to the NameNode.'''
+        calls = []
+        for path in paths:
+            request = client_proto.GetFileInfoRequestProto()
+            request.src = path
+            calls.append(("getFileInfo", request))
+        return self.service.call_many(calls)
+
     def _join_user_path(self, path):
         return posixpath.join("/user", get_current_username(), path)
 
@@ -1388,7 +1510,8 @@ class HAClient(Client):
 
     def __init__(self, namenodes, use_trash=False, effective_user=None, use_sasl=False, hdfs_namenode_principal=None,
                  max_failovers=15, max_retries=10, base_sleep=500, max_sleep=15000, sock_connect_timeout=10000,
-                 sock_request_timeout=10000, use_datanode_hostname=False):
+                 sock_request_timeout=10000, use_datanode_hostname=False, async_rpc=False,
+                 sock_rcvbuf_size=None, sock_sndbuf_size=None, validate_requests=True):
         '''
         :param namenodes: Set of namenodes for HA setup
         :type namenodes: list
@@ -1414,6 +1537,18 @@ class HAClient(Client):
         :type sock_request_timeout: int
         :param use_datanode_hostname: Use hostname instead of IP address to commuicate with datanodes
         :type use_datanode_hostname: boolean
+        :param async_rpc: Pipeline the RPCs of chmod, chown, chgrp and setrep, up to ASYNC_RPC_WINDOW at a time.
+            When a call fails, its error is raised once the rest of its window has been run, and the results of the
+            window's successful calls are dropped, although those changes were made. With recurse, the calls made
+            so far are run before a directory is listed, so a directory is changed before its children are listed.
+            A path that doesn't exist raises its error after the calls for the paths before it have been run.
+        :type async_rpc: boolean
+        :param sock_rcvbuf_size: Kernel receive buffer size of the NameNode and DataNode sockets in bytes (default: None - kernel default)
+        :type sock_rcvbuf_size: int
+        :param sock_sndbuf_size: Kernel send buffer size of the NameNode socket in bytes (default: None - kernel default)
+        :type sock_sndbuf_size: int
+        :param validate_requests: Check requests for missing required fields before sending them
+        :type validate_requests: boolean
         '''
         self.use_trash = use_trash
         self.effective_user = effective_user
@@ -1426,6 +1561,10 @@ class HAClient(Client):
         self.sock_connect_timeout = sock_connect_timeout
         self.sock_request_timeout = sock_request_timeout
         self.use_datanode_hostname = use_datanode_hostname
+        self.async_rpc = async_rpc
+        self.sock_rcvbuf_size = sock_rcvbuf_size
+        self.sock_sndbuf_size = sock_sndbuf_size
+        self.validate_requests = validate_requests
 
         self.failovers = -1
         self.retries = -1
@@ -1455,7 +1594,7 @@ class HAClient(Client):
         while (True):
             for namenode in namenodes:
                 self._check_failover(namenodes)
-                log.debug("Switch to namenode: %s:%d" % (namenode.host, namenode.port))
+                log.debug("Switch to namenode: %s:%d", namenode.host, namenode.port)
                 yield super(HAClient, self).__init__(namenode.host,
                                                      namenode.port,
                                                      namenode.version,
@@ -1465,7 +1604,11 @@ class HAClient(Client):
                                                      self.hdfs_namenode_principal,
                                                      self.sock_connect_timeout,
                                                      self.sock_request_timeout,
-                                                     self.use_datanode_hostname)
+                                                     self.use_datanode_hostname,
+                                                     self.async_rpc,
+                                                     self.sock_rcvbuf_size,
+                                                     self.sock_sndbuf_size,
+                                                     self.validate_requests)
 
 
     def __calculate_exponential_time(self, time, retries, cap):
@@ -1492,7 +1635,7 @@ class HAClient(Client):
             return True
 
     def __handle_request_error(self, exception):
-        log.debug("Request failed with %s" % exception)
+        log.debug("Request failed with %s", exception)
         if exception.args[0].startswith("org.apache.hadoop.ipc.StandbyException"):
             self.namenode.next() # Failover and retry until self.max_failovers was reached
         elif exception.args[0].startswith("org.apache.hadoop.ipc.RetriableException") and self.__should_retry():
@@ -1505,7 +1648,7 @@ class HAClient(Client):
             raise
 
     def __handle_socket_error(self, exception):
-        log.debug("Request failed with %s" % exception)
+        log.debug("Request failed with %s", exception)
         if exception.errno in (errno.ECONNREFUSED, errno.EHOSTUNREACH):
             # if NN is down or machine is not available, pass it:
             self.namenode.next() # Failover and retry until self.max_failovers was reached
@@ -1566,7 +1709,8 @@ class AutoConfigClient(HAClient):
         Different Hadoop distributions use different protocol versions. Snakebite defaults to 9, but this can be set by passing
         in the ``hadoop_version`` parameter to the constructor.
     '''
-    def __init__(self, hadoop_version=Namenode.DEFAULT_VERSION, effective_user=None, use_sasl=False):
+    def __init__(self, hadoop_version=Namenode.DEFAULT_VERSION, effective_user=None, use_sasl=False,
+                 sock_rcvbuf_size=None, sock_sndbuf_size=None, validate_requests=True):
         '''
         :param hadoop_version: What hadoop protocol version should be used (default: 9)
         :type hadoop_version: int
@@ -1574,6 +1718,12 @@ class AutoConfigClient(HAClient):
         :type effective_user: string
         :param use_sasl: Use SASL for authenication or not
         :type use_sasl: boolean
+        :param sock_rcvbuf_size: Kernel receive buffer size of the NameNode and DataNode sockets in bytes (default: None - kernel default)
+        :type sock_rcvbuf_size: int
+        :param sock_sndbuf_size: Kernel send buffer size of the NameNode socket in bytes (default: None - kernel default)
+        :type sock_sndbuf_size: int
+        :param validate_requests: Check requests for missing required fields before sending them
+        :type validate_requests: boolean
         '''
 
         configs = HDFSConfig.get_external_config()
@@ -1586,4 +1736,6 @@ class AutoConfigClient(HAClient):
                                                configs.get('failover_max_attempts'), configs.get('client_retries'),
                                                configs.get('client_sleep_base_millis'), configs.get('client_sleep_max_millis'),
                                                10000, configs.get('socket_timeout_millis'),
-                                               use_datanode_hostname=configs.get('use_datanode_hostname', False))
+                                               use_datanode_hostname=configs.get('use_datanode_hostname', False),
+                                               sock_rcvbuf_size=sock_rcvbuf_size, sock_sndbuf_size=sock_sndbuf_size,
+                                               validate_requests=validate_requests)
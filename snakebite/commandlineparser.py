@@ -20,7 +20,6 @@ import os
 import json
 from urlparse import urlparse
 
-from snakebite.client import HAClient
 from snakebite.errors import FileNotFoundException
 from snakebite.errors import DirectoryException
 from snakebite.errors import FileException
@@ -439,6 +438,10 @@ class CommandLineParser(object):
         return self.args
 
     def setup_client(self):
+        # Imported here so that parsing arguments and printing help doesn't
+        # have to load the client and its protobuf modules
+        from snakebite.client import HAClient
+
         if 'skiptrash' in self.args:
             use_trash = self.args.usetrash and not self.args.skiptrash
         else:
@@ -57,7 +57,7 @@ class HDFSConfig(object):
             # fs.default.name is the key name for the file system on EMR clusters
             if property.findall('name')[0].text in ('fs.defaultFS', 'fs.default.name'):
                 parse_result = urlparse(property.findall('value')[0].text)
-                log.debug("Got namenode '%s' from %s" % (parse_result.geturl(), core_site_path))
+                log.debug("Got namenode '%s' from %s", parse_result.geturl(), core_site_path)
 
                 namenodes.append({"namenode": parse_result.hostname,
                                "port": parse_result.port if parse_result.port
@@ -67,7 +67,7 @@ class HDFSConfig(object):
                 configs['use_trash'] = True
 
             if property.findall('name')[0].text == 'hadoop.security.authentication':
-                log.debug("Got hadoop.security.authentication '%s'" % (property.findall('value')[0].text))
+                log.debug("Got hadoop.security.authentication '%s'", property.findall('value')[0].text)
                 if property.findall('value')[0].text == 'kerberos':
                     configs['use_sasl'] = True
                 else:
@@ -86,7 +86,7 @@ class HDFSConfig(object):
         for property in cls.read_hadoop_config(hdfs_site_path):
             if property.findall('name')[0].text.startswith("dfs.namenode.rpc-address"):
                 parse_result = urlparse("//" + property.findall('value')[0].text)
-                log.debug("Got namenode '%s' from %s" % (parse_result.geturl(), hdfs_site_path))
+                log.debug("Got namenode '%s' from %s", parse_result.geturl(), hdfs_site_path)
                 namenodes.append({"namenode": parse_result.hostname,
                                 "port": parse_result.port if parse_result.port
                                                           else Namenode.DEFAULT_PORT})
@@ -95,7 +95,7 @@ class HDFSConfig(object):
                 configs['use_trash'] = True
 
             if property.findall('name')[0].text == 'dfs.namenode.kerberos.principal':
-                log.debug("hdfs principal found: '%s'" % (property.findall('value')[0].text))
+                log.debug("hdfs principal found: '%s'", property.findall('value')[0].text)
                 configs['hdfs_namenode_principal'] = property.findall('value')[0].text
 
             if property.findall('name')[0].text == 'dfs.client.retry.max.attempts':
@@ -105,21 +105,27 @@ def crc_update(crc, data):
 
     Args:
       crc: 32-bit checksum to update as long.
-      data: byte array, string or iterable over bytes.
+      data: byte array, string, buffer or iterable over bytes.
 
     Returns:
       32-bit updated CRC-32C as long.
     """
 
-    if type(data) != array.array or data.itemsize != 1:
+    if isinstance(data, buffer):
+        # array.array() iterates buffers as strings, fromstring() takes them
+        buf = array.array("B")
+        buf.fromstring(data)
+    elif type(data) != array.array or data.itemsize != 1:
         buf = array.array("B", data)
     else:
         buf = data
 
-    crc = crc ^ _MASK
+    # The table entries and crc >> 8 both fit in 32 bits, so no masking is
+    # needed inside the loop
+    table = CRC_TABLE
+    crc = (crc ^ _MASK) & _MASK
     for b in buf:
-        table_index = (crc ^ b) & 0xff
-        crc = (CRC_TABLE[table_index] ^ (crc >> 8)) & _MASK
+        crc = table[(crc ^ b) & 0xff] ^ (crc >> 8)
     return crc ^ _MASK
 
 
@@ -141,7 +147,7 @@ def crc(data):
     """Compute CRC-32C checksum of the data.
 
     Args:
-      data: byte array, string or iterable over bytes.
+      data: byte array, string, buffer or iterable over bytes.
 
     Returns:
       32-bit CRC-32C checksum of data as long.
@@ -6,8 +6,15 @@ if platform.system() != "Windows":
 else:
     import getpass
 
+# The user name lookup can go through NSS (LDAP etc.), so it's done once per uid
+_usernames = {}
+
 def get_current_username():
     if platform.system() != "Windows":
-        return pwd.getpwuid(os.getuid())[0]
+        uid = os.getuid()
+        username = _usernames.get(uid)
+        if username is None:
+            username = _usernames[uid] = pwd.getpwuid(uid)[0]
+        return username
     else:
-        return getpass.getuser()
\ No newline at end of file
+        return getpass.getuser()
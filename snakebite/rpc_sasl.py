@@ -45,7 +45,7 @@ import logger
 log = logger.getLogger(__name__)
 
 def log_protobuf_message(header, message):
-    log.debug("%s:\n\n\033[92m%s\033[0m" % (header, message))
+    log.debug("%s:\n\n\033[92m%s\033[0m", header, message)
 
 class SaslRpcClient:
     def __init__(self, trans, hdfs_namenode_principal=None):
@@ -68,9 +68,9 @@ class SaslRpcClient:
 
         header_length = len(s_rpcheader) + encoder._VarintSize(len(s_rpcheader)) + len(s_message) + encoder._VarintSize(len(s_message))
 
-        self._trans.write(struct.pack('!I', header_length))
-        self._trans.write_delimited(s_rpcheader)
-        self._trans.write_delimited(s_message)
+        self._trans.write(b"".join([struct.pack('!I', header_length),
+                                    encoder._VarintBytes(len(s_rpcheader)), s_rpcheader,
+                                    encoder._VarintBytes(len(s_message)), s_message]))
 
         log_protobuf_message("Send out", message)
 
@@ -102,10 +102,10 @@ class SaslRpcClient:
             for auth in res.auths:
                 mechs.append(auth.mechanism)
 
-            log.debug("Available mechs: %s" % (",".join(mechs)))
+            log.debug("Available mechs: %s", ",".join(mechs))
             s_mechs = str(",".join(mechs))
             ret, chosen_mech, initial_response = self.sasl.start(s_mechs)
-            log.debug("Chosen mech: %s" % chosen_mech)
+            log.debug("Chosen mech: %s", chosen_mech)
 
             initiate = RpcSaslProto()
             initiate.state = 2
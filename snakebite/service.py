@@ -20,7 +20,8 @@ import google.protobuf.service as service
 class RpcService(object):
     def __init__(self, service_stub_class, port, host, hadoop_version, effective_user=None,
                  use_sasl=False, hdfs_namenode_principal=None, sock_connect_timeout=10000,
-                 sock_request_timeout=10000):
+                 sock_request_timeout=10000, sock_rcvbuf_size=None, sock_sndbuf_size=None,
+                 validate_requests=True):
         self.service_stub_class = service_stub_class
         self.port = port
         self.host = host
@@ -30,7 +31,10 @@ class RpcService(object):
                                         effective_user=effective_user, use_sasl=use_sasl,
                                         hdfs_namenode_principal=hdfs_namenode_principal,
                                         sock_connect_timeout=sock_connect_timeout,
-                                        sock_request_timeout=sock_request_timeout,)
+                                        sock_request_timeout=sock_request_timeout,
+                                        sock_rcvbuf_size=sock_rcvbuf_size,
+                                        sock_sndbuf_size=sock_sndbuf_size,
+                                        validate_requests=validate_requests)
         self.service = self.service_stub_class(self.channel)
 
         # go through service_stub methods and add a wrapper function to
@@ -45,6 +49,16 @@ class RpcService(object):
         controller = SocketRpcController()
         return method(self.service, controller, request)
 
+    def call_many(self, calls):
+        '''Calls several methods at once, pipelined on the channel. calls is a list of
+        (method name, request) tuples, the responses are returned in the same order.'''
+        descriptor = self.service_stub_class.GetDescriptor()
+        rpc_calls = []
+        for (method_name, request) in calls:
+            method = descriptor.methods_by_name[method_name]
+            rpc_calls.append((method, request, self.service.GetResponseClass(method)))
+        return self.channel.call_many(rpc_calls)
+
 
 class SocketRpcController(service.RpcController):
     ''' RpcController implementation to be used by the SocketRpcChannel class.
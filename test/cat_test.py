@@ -14,6 +14,7 @@
 # the License.
 
 from minicluster_testbase import MiniClusterTestBase
+from snakebite.errors import FileNotFoundException
 import os
 
 
@@ -71,6 +72,18 @@ class CatTest(MiniClusterTestBase):
         expected_output = self.cluster.cat('/temp_test3')
         self.assertEqual(expected_output, client_output)
 
+    def test_cat_multiple_files(self):
+        paths = ['/test3', '/zerofile', '/test1']
+        self.client.ASYNC_RPC_WINDOW = 2  # Prefetch the file info in several windows
+        client_output = [''.join(file_to_read) for file_to_read in self.client.cat(paths)]
+        expected_output = [self.cluster.cat(path) for path in paths]
+        self.assertEqual(expected_output, client_output)
+
+    def test_cat_multiple_files_with_unknown_file(self):
+        result = self.client.cat(['/test3', '/doesnotexist', '/zerofile'])
+        self.assertEqual(''.join(result.next()), self.cluster.cat('/test3'))
+        self.assertRaises(FileNotFoundException, result.next)
+
     def _write_to_test_cluster(self, testfile, times, dst, block_size=134217728):
         testfiles_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "testfiles")
         f = open(''.join([testfiles_path, testfile]))
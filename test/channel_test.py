@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Spotify AB
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy of
+# the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+import socket
+import struct
+import threading
+import unittest2
+
+from google.protobuf.internal import decoder, encoder
+
+import snakebite.protobuf.ClientNamenodeProtocol_pb2 as client_proto
+from snakebite.protobuf.hdfs_pb2 import HdfsFileStatusProto
+from snakebite.protobuf.RpcHeader_pb2 import RpcRequestHeaderProto, RpcResponseHeaderProto
+from snakebite.errors import FatalException, RequestError, TransientException
+from snakebite.channel import RpcBufferedReader, SocketRpcChannel, has_required_fields
+from snakebite.service import RpcService
+
+
+def delimited(message):
+    data = message.SerializeToString()
+    return encoder._VarintBytes(len(data)) + data
+
+
+def rpc_response(call_id, response=None, exception_class_name=None):
+    '''An RPC response the way the NameNode sends it: a failed call only has a header.'''
+    header = RpcResponseHeaderProto()
+    header.callId = call_id
+    if exception_class_name:
+        header.status = RpcResponseHeaderProto.ERROR
+        header.exceptionClassName = exception_class_name
+        header.errorMsg = "call %d failed" % call_id
+        body = delimited(header)
+    else:
+        header.status = RpcResponseHeaderProto.SUCCESS
+        body = delimited(header) + delimited(response)
+    return struct.pack("!I", len(body)) + body
+
+
+def recv_exactly(sock, n):
+    data = b""
+    while len(data) < n:
+        received = sock.recv(n - len(data))
+        if not received:
+            raise EOFError("Socket closed after %d out of %d bytes" % (len(data), n))
+        data += received
+    return data
+
+
+def recv_rpc_request(sock):
+    '''Returns the header and the serialized request of the next RPC request on sock.'''
+    length = struct.unpack("!I", recv_exactly(sock, 4))[0]
+    data = recv_exactly(sock, length)
+    messages = []
+    pos = 0
+    while pos < len(data):
+        (size, pos) = decoder._DecodeVarint32(data, pos)
+        messages.append(data[pos:pos + size])
+        pos += size
+    header = RpcRequestHeaderProto()
+    header.ParseFromString(messages[0])
+    return (header, messages[2])
+
+
+def file_info_request(path):
+    request = client_proto.GetFileInfoRequestProto()
+    request.src = path
+    return request
+
+
+def file_info_response(path):
+    response = client_proto.GetFileInfoResponseProto()
+    response.fs.fileType = HdfsFileStatusProto.IS_FILE
+    response.fs.path = path
+    response.fs.length = 0
+    response.fs.permission.perm = 0644
+    response.fs.owner = "owner"
+    response.fs.group = "group"
+    response.fs.modification_time = 0
+    response.fs.access_time = 0
+    return response
+
+
+class RpcBufferedReaderTest(unittest2.TestCase):
+
+    def setUp(self):
+        (self.sock, self.server_sock) = socket.socketpair()
+        self.sock.settimeout(10)
+
+    def tearDown(self):
+        self.sock.close()
+        self.server_sock.close()
+
+    def test_read_varint32_split_across_recvs(self):
+        reader = RpcBufferedReader(self.sock)
+        varint = encoder._VarintBytes(300000)
+        self.assertEqual(len(varint), 3)
+        self.server_sock.sendall(varint[:1])
+        reader.fill(1)
+        self.assertEqual(reader.buffer_length, 1)
+        self.server_sock.sendall(varint[1:] + b"next")
+        self.assertEqual(reader.read_varint32(), 300000)
+        self.assertEqual(reader.read(4), b"next")
+
+    def test_read_varint32_single_byte(self):
+        reader = RpcBufferedReader(self.sock)
+        self.server_sock.sendall(b"\x05\x7f")
+        self.assertEqual(reader.read_varint32(), 5)
+        self.assertEqual(reader.read_varint32(), 127)
+
+    def test_read_varint32_too_long(self):
+        reader = RpcBufferedReader(self.sock)
+        self.server_sock.sendall(b"\xff" * 6)
+        self.assertRaises(FatalException, reader.read_varint32)
+
+    def test_read_ahead_kept_across_reset(self):
+        reader = RpcBufferedReader(self.sock)
+        # Two replies back to back, which arrive in a single recv
+        self.server_sock.sendall(b"first" + b"second")
+        self.assertEqual(reader.read(5), b"first")
+        self.assertEqual(reader.buffer_length, 11)
+        buf = reader.buffer
+        reader.reset()
+        self.assertIs(reader.buffer, buf)
+        self.assertEqual(reader.buffer_length, 6)
+        self.assertEqual(reader.read(6), b"second")
+
+    def test_large_buffer_not_kept_by_reset(self):
+        reader = RpcBufferedReader(self.sock)
+        data = b"x" * (reader.MAX_KEPT_BUFFER_SIZE + 1)
+        # More than the socket buffers hold, so it's sent while it's being read
+        sender = threading.Thread(target=self.server_sock.sendall, args=(data + b"next",))
+        sender.start()
+        self.assertEqual(reader.read(len(data)), data)
+        self.assertTrue(len(reader.buffer) > reader.MAX_KEPT_BUFFER_SIZE)
+        reader.reset()
+        self.assertTrue(len(reader.buffer) < reader.MAX_KEPT_BUFFER_SIZE)
+        self.assertEqual(reader.read(4), b"next")
+        sender.join()
+
+    def test_fill(self):
+        reader = RpcBufferedReader(self.sock, read_ahead=False)
+        self.server_sock.sendall(b"0123456789")
+        self.assertEqual(reader.read(2), b"01")
+        self.assertEqual(reader.buffer_length, 2)
+        reader.fill(5)
+        self.assertEqual(reader.buffer_length, 7)
+        # Filled bytes are read from the buffer, without touching the socket
+        self.server_sock.close()
+        reader.fill(3)
+        self.assertEqual(reader.read(5), b"23456")
+
+    def test_closed_socket(self):
+        reader = RpcBufferedReader(self.sock, read_ahead=False)
+        self.server_sock.sendall(b"012")
+        self.server_sock.close()
+        self.assertRaises(TransientException, reader.read, 4)
+
+
+class HasRequiredFieldsTest(unittest2.TestCase):
+    def test_required_field(self):
+        self.assertTrue(has_required_fields(client_proto.GetFileInfoRequestProto.DESCRIPTOR))
+
+    def test_no_fields(self):
+        self.assertFalse(has_required_fields(client_proto.GetServerDefaultsRequestProto.DESCRIPTOR))
+
+    def test_required_field_in_nested_message(self):
+        # Only optional fields itself, but HdfsFileStatusProto has required ones
+        self.assertTrue(has_required_fields(client_proto.GetFileInfoResponseProto.DESCRIPTOR))
+
+
+class RpcRequestHeaderTest(unittest2.TestCase):
+    '''create_rpc_request_header splices the callId into a pre-serialized header, which
+    has to give the same bytes as serializing the whole message.'''
+
+    def setUp(self):
+        self.channel = SocketRpcChannel("localhost", 8020, 9)
+
+    def serialized_header(self, call_id):
+        header = RpcRequestHeaderProto()
+        header.rpcKind = 2
+        header.rpcOp = 0
+        header.callId = call_id
+        header.clientId = self.channel.client_id
+        header.retryCount = -1
+        return header.SerializeToString()
+
+    def test_connection_context_call_id(self):
+        self.assertEqual(self.channel.create_rpc_request_header(), self.serialized_header(-3))
+        self.assertEqual(self.channel.call_id, 0)
+
+    def test_call_ids(self):
+        self.channel.create_rpc_request_header()
+        self.assertEqual(self.channel.create_rpc_request_header(), self.serialized_header(0))
+        self.assertEqual(self.channel.create_rpc_request_header(), self.serialized_header(1))
+
+    def test_multi_byte_call_ids(self):
+        for call_id in [64, 300000, 2 ** 31 - 1]:
+            self.channel.call_id = call_id
+            self.assertEqual(self.channel.create_rpc_request_header(), self.serialized_header(call_id))
+            self.assertEqual(self.channel.call_id, call_id + 1)
+
+
+class CallManyTest(unittest2.TestCase):
+    '''RpcService.call_many against a fake NameNode on the other end of a socket pair.'''
+
+    def setUp(self):
+        self.service = RpcService(client_proto.ClientNamenodeProtocol_Stub, 8020, "localhost", 9)
+        (self.sock, self.server_sock) = socket.socketpair()
+        self.sock.settimeout(10)
+        self.server_sock.settimeout(10)
+        # Act as if the connection has been set up, which takes callId -3
+        self.service.channel.sock = self.sock
+        self.service.channel.call_id = 0
+
+    def tearDown(self):
+        self.sock.close()
+        self.server_sock.close()
+
+    def call_many(self, paths):
+        return self.service.call_many([("getFileInfo", file_info_request(path)) for path in paths])
+
+    def test_out_of_order_responses(self):
+        paths = ["/a", "/b", "/c"]
+        # The responses are small enough to be sent before the requests are read
+        for call_id in [2, 0, 1]:
+            self.server_sock.sendall(rpc_response(call_id, file_info_response(paths[call_id])))
+
+        responses = self.call_many(paths)
+        self.assertEqual([response.fs.path for response in responses], paths)
+
+        for (call_id, path) in enumerate(paths):
+            (header, request) = recv_rpc_request(self.server_sock)
+            self.assertEqual(header.callId, call_id)
+            self.assertEqual(client_proto.GetFileInfoRequestProto.FromString(request).src, path)
+
+    def test_error_response(self):
+        paths = ["/a", "/b", "/c"]
+        self.server_sock.sendall(rpc_response(2, file_info_response("/c")))
+        self.server_sock.sendall(rpc_response(1, exception_class_name="org.apache.hadoop.security.AccessControlException"))
+        self.server_sock.sendall(rpc_response(0, file_info_response("/a")))
+
+        with self.assertRaises(RequestError) as context:
+            self.call_many(paths)
+        self.assertIn("AccessControlException", str(context.exception))
+        self.assertIn("call 1 failed", str(context.exception))
+
+        # All responses were read, so the connection is still in sync
+        self.assertIs(self.service.channel.sock, self.sock)
+        self.server_sock.sendall(rpc_response(3, file_info_response("/d")))
+        self.assertEqual(self.call_many(["/d"])[0].fs.path, "/d")
+
+    def test_unexpected_response(self):
+        self.server_sock.sendall(rpc_response(5, file_info_response("/a")))
+        self.assertRaises(FatalException, self.call_many, ["/a"])
+        # The stream can't be trusted anymore, so the socket is closed
+        self.assertIsNone(self.service.channel.sock)
@@ -40,6 +40,25 @@ class ChgrpTest(MiniClusterTestBase):
         result = self.client.chgrp(['/nonexistent'], 'myOnwer', recurse=True)
         self.assertRaises(FileNotFoundException, result.next)
 
+    def test_async_recursive(self):
+        self.client.async_rpc = True
+        self.client.ASYNC_RPC_WINDOW = 4  # Pipeline the calls in several windows
+        client_output = list(self.client.chgrp(['/'], 'asyncgroup', recurse=True))
+        self.assertTrue(len(client_output) > self.client.ASYNC_RPC_WINDOW)
+        expected_output = self.cluster.ls(["/"], ["-R"])
+        self.assertEqual(len(client_output), len(expected_output) + 1)
+        for node in expected_output:
+            self.assertEqual(node["group"], "asyncgroup")
+
+    def test_async_unknown_file(self):
+        self.client.async_rpc = True
+        result = self.client.chgrp(['/dir1', '/nonexistent', '/zerofile'], 'asyncunknowngroup')
+        self.assertEqual(result.next()['path'], '/dir1')
+        self.assertRaises(FileNotFoundException, result.next)
+        client_output = list(self.client.ls(['/dir1', '/zerofile'], include_toplevel=True, include_children=False))
+        self.assertEqual(client_output[0]["group"], "asyncunknowngroup")
+        self.assertNotEqual(client_output[1]["group"], "asyncunknowngroup")
+
     def test_invalid_input(self):
         result = self.client.chgrp('/doesnotexist', 'myOnwer')
         self.assertRaises(InvalidInputException, result.next)
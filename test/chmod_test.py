@@ -40,6 +40,25 @@ class ChmodTest(MiniClusterTestBase):
         result = self.client.chmod(['/nonexistent'], 0777, recurse=True)
         self.assertRaises(FileNotFoundException, result.next)
 
+    def test_async_recursive(self):
+        self.client.async_rpc = True
+        self.client.ASYNC_RPC_WINDOW = 4  # Pipeline the calls in several windows
+        client_output = list(self.client.chmod(['/'], 0750, recurse=True))
+        self.assertTrue(len(client_output) > self.client.ASYNC_RPC_WINDOW)
+        expected_output = self.cluster.ls(["/"], ["-R"])
+        self.assertEqual(len(client_output), len(expected_output) + 1)
+        for node in expected_output:
+            self.assertEqual(node["permission"], 488)
+
+    def test_async_unknown_file(self):
+        self.client.async_rpc = True
+        result = self.client.chmod(['/dir1', '/nonexistent', '/zerofile'], 0701)
+        self.assertEqual(result.next()['path'], '/dir1')
+        self.assertRaises(FileNotFoundException, result.next)
+        client_output = list(self.client.ls(['/dir1', '/zerofile'], include_toplevel=True, include_children=False))
+        self.assertEqual(client_output[0]["permission"], 449)
+        self.assertNotEqual(client_output[1]["permission"], 449)
+
     def test_invalid_input(self):
         result = self.client.chmod('/stringpath', 777)
         self.assertRaises(InvalidInputException, result.next)
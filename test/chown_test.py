@@ -40,6 +40,25 @@ class ChownTest(MiniClusterTestBase):
         result = self.client.chown(['/nonexistent'], 'myGroup', recurse=True)
         self.assertRaises(FileNotFoundException, result.next)
 
+    def test_async_recursive(self):
+        self.client.async_rpc = True
+        self.client.ASYNC_RPC_WINDOW = 4  # Pipeline the calls in several windows
+        client_output = list(self.client.chown(['/'], 'asyncowner', recurse=True))
+        self.assertTrue(len(client_output) > self.client.ASYNC_RPC_WINDOW)
+        expected_output = self.cluster.ls(["/"], ["-R"])
+        self.assertEqual(len(client_output), len(expected_output) + 1)
+        for node in expected_output:
+            self.assertEqual(node["owner"], "asyncowner")
+
+    def test_async_unknown_file(self):
+        self.client.async_rpc = True
+        result = self.client.chown(['/dir1', '/nonexistent', '/zerofile'], 'asyncunknownowner')
+        self.assertEqual(result.next()['path'], '/dir1')
+        self.assertRaises(FileNotFoundException, result.next)
+        client_output = list(self.client.ls(['/dir1', '/zerofile'], include_toplevel=True, include_children=False))
+        self.assertEqual(client_output[0]["owner"], "asyncunknownowner")
+        self.assertNotEqual(client_output[1]["owner"], "asyncunknownowner")
+
     def test_user_group(self):
         list(self.client.chown(['/dir1'], "myUser:myGroup"))
         client_output = list(self.client.ls(['/dir1'], include_toplevel=True, include_children=False))
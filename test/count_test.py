@@ -36,6 +36,20 @@ class CountTest(MiniClusterTestBase):
             for key in ['path', 'length', 'directoryCount', 'fileCount']:
                 self.assertEqual(client_node[key], expected_node[key])
 
+    def test_count_multi_in_order(self):
+        paths = ["/dir1", "/dir2", "/zerofile", "/test1"]
+        self.client.ASYNC_RPC_WINDOW = 2  # Prefetch the file info in several windows
+        client_output = list(self.client.count(paths))
+        self.assertEqual([node['path'] for node in client_output], paths)
+        for client_node, expected_node in zip(client_output, self.cluster.count(paths)):
+            for key in ['path', 'length', 'directoryCount', 'fileCount']:
+                self.assertEqual(client_node[key], expected_node[key])
+
+    def test_count_multi_with_unknown_file(self):
+        result = self.client.count(["/dir1", "/doesnotexist", "/dir2"])
+        self.assertEqual(result.next()['path'], "/dir1")
+        self.assertRaises(FileNotFoundException, result.next)
+
     def test_unknown_file(self):
         result = self.client.count(['/doesnotexist'])
         self.assertRaises(FileNotFoundException, result.next)
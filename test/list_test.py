@@ -60,6 +60,19 @@ class ListTest(MiniClusterTestBase):
         self.assertEqual(client_output[0]['path'], '/dir1')
         self.assertEqual(client_output[1]['path'], '/zerofile')
 
+    def test_multiple_files_in_order(self):
+        paths = ['/zerofile', '/dir1', '/test3', '/dir2', '/test1']
+        self.client.ASYNC_RPC_WINDOW = 2  # Prefetch the file info in several windows
+        client_output = list(self.client.ls(paths, include_toplevel=True, include_children=False))
+        self.assertEqual([node['path'] for node in client_output], paths)
+
+    def test_multiple_files_with_unknown_file(self):
+        paths = ['/zerofile', '/dir1', '/doesnotexist', '/test3']
+        result = self.client.ls(paths, include_toplevel=True, include_children=False)
+        self.assertEqual(result.next()['path'], '/zerofile')
+        self.assertEqual(result.next()['path'], '/dir1')
+        self.assertRaises(FileNotFoundException, result.next)
+
     def test_glob(self):
         expected_output = self.cluster.ls(['/b*'])
         client_output = list(self.client.ls(['/b*']))